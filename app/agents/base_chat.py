@@ -1,32 +1,103 @@
+import asyncio
+import os
+import shutil
+import tempfile
 import torch
 from datetime import datetime
-from transformers import pipeline
+from transformers import AutoTokenizer, pipeline
 from ..protocol.schemas import AgentRequest, AgentResponse
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional
+
+try:
+    # Optional: ONNX Runtime int8 inference on CPU (AVX512-VNNI)
+    from optimum.onnxruntime import ORTModelForCausalLM, ORTQuantizer
+    from optimum.onnxruntime.configuration import AutoQuantizationConfig
+except ImportError:
+    ORTModelForCausalLM = None
+
+MODEL_NAME = "gpt2"  # Replace with MedPaLM when available
+QUANTIZED_MODEL_DIR = os.getenv('QUANTIZED_MODEL_DIR', 'models/gpt2-int8')
 
 class BaseChatAgent:
+    # Dynamic batching: collect up to MAX_BATCH_SIZE prompts or wait BATCH_WINDOW_MS
+    MAX_BATCH_SIZE: int = 8
+    BATCH_WINDOW_MS: int = 10
+    MAX_NEW_TOKENS: int = 50
+    # Bounded so overload blocks callers in _generate instead of growing memory
+    MAX_QUEUE_SIZE: int = 64
+
     def __init__(self):
-        self.model = pipeline(
-            "text-generation",
-            model="gpt2",  # Replace with MedPaLM when available
-            device=0 if torch.cuda.is_available() else -1
-        )
+        self.model = self._load_model()
+        # GPT-2 has no pad token; reuse EOS so batched prompts can be padded.
+        # Decoder-only models must be left-padded so generation continues
+        # directly from each prompt's last real token.
+        self.model.tokenizer.pad_token_id = self.model.model.config.eos_token_id
+        self.model.tokenizer.padding_side = "left"
         self.context_manager = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    def _load_model(self):
+        """Load FP16 weights on GPU, int8 ONNX on CPU when optimum is available"""
+        if torch.cuda.is_available():
+            return pipeline(
+                "text-generation",
+                model=MODEL_NAME,
+                device=0,
+                torch_dtype=torch.float16
+            )
+        if ORTModelForCausalLM is not None:
+            return self._load_quantized_model()
+        return pipeline("text-generation", model=MODEL_NAME, device=-1)
+
+    def _load_quantized_model(self):
+        """Export and dynamically quantize the model to int8 once, then reuse it"""
+        if not os.path.isdir(QUANTIZED_MODEL_DIR):
+            self._export_quantized_model()
+
+        model = ORTModelForCausalLM.from_pretrained(
+            QUANTIZED_MODEL_DIR,
+            file_name="model_quantized.onnx"
+        )
+        tokenizer = AutoTokenizer.from_pretrained(QUANTIZED_MODEL_DIR)
+        return pipeline("text-generation", model=model, tokenizer=tokenizer)
+
+    def _export_quantized_model(self):
+        """Quantize into a temporary directory and rename it into place.
+
+        Several workers may start at once; the rename is atomic, so none of
+        them can load a half-written QUANTIZED_MODEL_DIR.
+        """
+        parent = os.path.dirname(os.path.abspath(QUANTIZED_MODEL_DIR))
+        os.makedirs(parent, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".quantize-")
+        try:
+            model = ORTModelForCausalLM.from_pretrained(MODEL_NAME, export=True)
+            quantizer = ORTQuantizer.from_pretrained(model)
+            qconfig = AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+            quantizer.quantize(save_dir=tmp_dir, quantization_config=qconfig)
+            AutoTokenizer.from_pretrained(MODEL_NAME).save_pretrained(tmp_dir)
+            try:
+                os.rename(tmp_dir, QUANTIZED_MODEL_DIR)
+            except OSError:
+                # Another worker finished first; use its copy
+                if not os.path.isdir(QUANTIZED_MODEL_DIR):
+                    raise
+        finally:
+            if os.path.isdir(tmp_dir):
+                shutil.rmtree(tmp_dir, ignore_errors=True)
 
     async def process(self, request: AgentRequest) -> AgentResponse:
         # Generate response using the model
-        response = self.model(
-            request.input_text,
-            max_length=100,
-            num_return_sequences=1
-        )[0]['generated_text']
-
-        # Update context with the interaction
-        updated_context = request.context.copy()
-        updated_context['last_interaction'] = {
-            'input': request.input_text,
-            'response': response,
-            'timestamp': datetime.now().isoformat()
+        response = await self._generate(request.input_text)
+
+        # Return only the keys that changed; MCPClient merges them into the context
+        updated_context = {
+            'last_interaction': {
+                'input': request.input_text,
+                'response': response,
+                'timestamp': datetime.now().isoformat()
+            }
         }
 
         return AgentResponse(
@@ -35,5 +106,98 @@ class BaseChatAgent:
             confidence=0.8  # Placeholder confidence score
         )
 
+    async def _generate(self, input_text: str) -> str:
+        """Queue a prompt for the batch worker and wait for its completion"""
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((input_text, future))
+        return await future
+
+    def _ensure_worker(self):
+        """Start the batch worker on the running event loop if needed"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.MAX_QUEUE_SIZE)
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._batch_worker())
+
+    async def _batch_worker(self):
+        """Pull queued prompts into batches and run one forward pass per batch"""
+        while True:
+            batch = []
+            try:
+                await self._run_batch(batch)
+            except asyncio.CancelledError:
+                # Shutdown: fail whatever was already pulled off the queue
+                for _, future in batch:
+                    if not future.done():
+                        future.cancel()
+                raise
+
+    async def _run_batch(self, batch: list):
+        """Fill `batch` within the batching window, generate, and resolve its futures"""
+        loop = asyncio.get_running_loop()
+        batch.append(await self._queue.get())
+        deadline = loop.time() + self.BATCH_WINDOW_MS / 1000
+        while len(batch) < self.MAX_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+        try:
+            outputs = await asyncio.to_thread(
+                self._generate_batch, [text for text, _ in batch]
+            )
+        except Exception as e:
+            if len(batch) == 1:
+                if not batch[0][1].done():
+                    batch[0][1].set_exception(e)
+                return
+            # Retry one prompt at a time so only the failing request fails
+            for text, future in batch:
+                try:
+                    output = (await asyncio.to_thread(self._generate_batch, [text]))[0]
+                except Exception as prompt_error:
+                    if not future.done():
+                        future.set_exception(prompt_error)
+                else:
+                    if not future.done():
+                        future.set_result(output)
+            return
+
+        for (_, future), output in zip(batch, outputs):
+            if not future.done():
+                future.set_result(output)
+
+    def _generate_batch(self, texts: List[str]) -> List[str]:
+        """Run the text-generation pipeline over a batch of prompts"""
+        # No per-user K/V cache across turns: each prompt is only the current
+        # message, so consecutive turns share no prefix whose K/V could be reused
+        outputs = self.model(
+            texts,
+            max_new_tokens=self.MAX_NEW_TOKENS,
+            num_return_sequences=1,
+            batch_size=len(texts)
+        )
+        return [output[0]['generated_text'] for output in outputs]
+
+    async def close(self):
+        """Stop the batch worker and cancel requests still waiting in the queue"""
+        if self._worker is not None and not self._worker.done():
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+        self._worker = None
+
+        while self._queue is not None and not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.cancel()
+
     def set_context_manager(self, context_manager):
-        self.context_manager = context_manager 
\ No newline at end of file
+        self.context_manager = context_manager
@@ -2,9 +2,13 @@ from typing import Optional
 import os
 from dotenv import load_dotenv
 import secrets
+import logging
+import platform
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 def validate_env_vars():
     """Validate required environment variables"""
     required_vars = {
@@ -23,6 +27,10 @@ class RedisConfig:
     PASSWORD: Optional[str] = os.getenv('REDIS_PASSWORD')
     SSL: bool = os.getenv('REDIS_SSL', 'true').lower() == 'true'
     TTL: int = int(os.getenv('REDIS_TTL', 86400))  # 24 hours in seconds
+    MAX_INTERACTIONS: int = int(os.getenv('REDIS_MAX_INTERACTIONS', 1000))
+    MAX_CONNECTIONS: int = int(os.getenv('REDIS_MAX_CONNECTIONS', max(32, 4 * (os.cpu_count() or 1))))
+    HEALTH_CHECK_INTERVAL: int = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', 30))
+    SOCKET_TIMEOUT: float = float(os.getenv('REDIS_SOCKET_TIMEOUT', 30))
     
     @classmethod
     def validate(cls):
@@ -33,15 +41,25 @@ class RedisConfig:
             raise ValueError("Invalid Redis port")
         if cls.TTL < 1:
             raise ValueError("TTL must be positive")
+        if cls.MAX_INTERACTIONS < 1:
+            raise ValueError("MAX_INTERACTIONS must be positive")
+        if cls.MAX_CONNECTIONS < 1:
+            raise ValueError("MAX_CONNECTIONS must be positive")
+        if cls.SOCKET_TIMEOUT <= 0:
+            raise ValueError("SOCKET_TIMEOUT must be positive")
 
 class EncryptionConfig:
     ENCRYPTION_KEY: str = os.getenv('ENCRYPTION_KEY')
     ALGORITHM: str = "AES-256-GCM"
-    KEY_DERIVATION: str = "PBKDF2"
-    ITERATIONS: int = 100000
+    KEY_DERIVATION: str = os.getenv('KEY_DERIVATION', 'HKDF').upper()  # HKDF or PBKDF2
+    HKDF_INFO: bytes = b"twincare-aesgcm"
+    ITERATIONS: int = int(os.getenv('PBKDF2_ITERATIONS', 100000))
     SALT_LENGTH: int = 16
     TAG_LENGTH: int = 16
     NONCE_LENGTH: int = 12
+    THREAD_OFFLOAD_BYTES: int = 16 * 1024  # AES-GCM above this runs off the event loop
+    COMPRESSION_LEVEL: int = int(os.getenv('ZSTD_LEVEL', 3))
+    ZSTD_DICT_PATH: str = os.getenv('ZSTD_DICT_PATH', 'context.zdict')
     
     @classmethod
     def validate(cls):
@@ -50,6 +68,51 @@ class EncryptionConfig:
             raise ValueError("Encryption key is required")
         if len(cls.ENCRYPTION_KEY) < 32:
             raise ValueError("Encryption key must be at least 32 bytes")
+        if cls.KEY_DERIVATION not in ('HKDF', 'PBKDF2'):
+            raise ValueError("KEY_DERIVATION must be HKDF or PBKDF2")
+        if cls.ITERATIONS < 1:
+            raise ValueError("PBKDF2 iterations must be positive")
+        cls.check_hardware_acceleration()
+
+    @classmethod
+    def check_hardware_acceleration(cls) -> bool:
+        """Warn if the CPU lacks the AES/carry-less multiply instructions AES-GCM needs"""
+        machine = platform.machine().lower()
+        if machine in ('x86_64', 'amd64', 'i386', 'i686'):
+            # x86 lists features on "flags"; GCM needs AES-NI + PCLMULQDQ
+            field, required = 'flags', ('aes', 'pclmulqdq')
+        elif machine in ('aarch64', 'arm64'):
+            # ARMv8 lists features on "Features"; GCM needs AES + PMULL
+            field, required = 'Features', ('aes', 'pmull')
+        else:
+            # No known feature names to probe on this architecture
+            return True
+
+        try:
+            with open('/proc/cpuinfo') as f:
+                flags = next(
+                    (line.split(':', 1)[1].split() for line in f if line.startswith(field)),
+                    []
+                )
+        except OSError:
+            # Not Linux or /proc unavailable; nothing to probe
+            return True
+
+        missing = [flag for flag in required if flag not in flags]
+        if missing:
+            logger.warning(
+                f"CPU lacks {', '.join(missing)}; AES-GCM will use the slow software path"
+            )
+            return False
+
+        # OPENSSL_ia32cap can mask CPU features even when the hardware has them
+        if field == 'flags' and os.getenv('OPENSSL_ia32cap'):
+            logger.warning(
+                f"OPENSSL_ia32cap is set ({os.getenv('OPENSSL_ia32cap')}); "
+                "unset it unless you intend to disable AES-NI/CLMUL"
+            )
+            return False
+        return True
 
 # Validate configurations
 validate_env_vars()
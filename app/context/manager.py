@@ -1,134 +1,423 @@
-from typing import Dict, Any, Optional
-import json
+from typing import Dict, Any, List, Optional
+import asyncio
+import socket
+import orjson
+import msgpack
+import zstandard as zstd
 from datetime import datetime
-import redis
-from redis.retry import Retry
+import redis.asyncio as redis
+from redis.asyncio.retry import Retry
 from redis.backoff import ExponentialBackoff
 from redis.exceptions import RedisError, ConnectionError
-from ..config.redis_config import RedisConfig
-from ..utils.encryption import EncryptionService, EncryptionError
+from ..config.redis_config import RedisConfig, EncryptionConfig
+from ..utils.encryption import encryption_service, EncryptionError
 import logging
 
 logger = logging.getLogger(__name__)
 
+JSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_SERIALIZE_DATACLASS
+
+def _pack(context: Dict[str, Any]) -> bytes:
+    """Serialize a context to MessagePack for storage in Redis"""
+    return msgpack.packb(context, use_bin_type=True)
+
+def _unpack(payload: bytes) -> Dict[str, Any]:
+    """Deserialize a stored context from MessagePack"""
+    return msgpack.unpackb(payload, raw=False)
+
 class ContextManager:
     def __init__(self):
-        # Configure Redis connection pool
-        self.pool = redis.ConnectionPool(
+        # Configure retry strategy
+        retry = Retry(
+            ExponentialBackoff(),
+            retries=3
+        )
+
+        # Configure Redis connection pool; callers wait for a free connection
+        # instead of failing once MAX_CONNECTIONS are checked out. Retry is set
+        # here because pooled connections do not inherit it from the client.
+        self.pool = redis.BlockingConnectionPool(
             host=RedisConfig.HOST,
             port=RedisConfig.PORT,
             db=RedisConfig.DB,
             password=RedisConfig.PASSWORD,
             ssl=RedisConfig.SSL,
-            decode_responses=True,
-            max_connections=10
-        )
-        
-        # Configure retry strategy
-        retry = Retry(
-            ExponentialBackoff(),
-            retries=3,
-            timeout=30
-        )
-        
-        self.redis_client = redis.Redis(
-            connection_pool=self.pool,
+            decode_responses=False,  # contexts are stored as raw encrypted bytes
+            max_connections=RedisConfig.MAX_CONNECTIONS,
+            socket_timeout=RedisConfig.SOCKET_TIMEOUT,
+            socket_keepalive=True,
+            socket_keepalive_options=self._keepalive_options(),
+            health_check_interval=RedisConfig.HEALTH_CHECK_INTERVAL,
             retry=retry
         )
-        
-        self.encryption_service = EncryptionService()
+
+        self.redis_client = redis.Redis(connection_pool=self.pool)
+
+        self.encryption_service = encryption_service
         self.ttl = RedisConfig.TTL
 
+    @staticmethod
+    def _keepalive_options() -> Dict[int, int]:
+        """TCP keepalive tuning so idle pooled connections survive NAT timeouts"""
+        options = {}
+        for name, value in (('TCP_KEEPIDLE', 60), ('TCP_KEEPINTVL', 10), ('TCP_KEEPCNT', 3)):
+            # Not every platform exposes all three (e.g. TCP_KEEPIDLE on macOS)
+            if hasattr(socket, name):
+                options[getattr(socket, name)] = value
+        return options
+
+    async def close(self) -> None:
+        """Close all pooled Redis connections"""
+        await self.pool.disconnect()
+
     def _get_key(self, user_id: str) -> str:
         """Generate Redis key for user context"""
         return f"context:{user_id}"
 
+    def _get_interactions_key(self, user_id: str) -> str:
+        """Generate Redis key for a user's interaction history list"""
+        return f"context:{user_id}:interactions"
+
+    def _new_context(self) -> Dict[str, Any]:
+        """Build an empty context for a first-time user"""
+        now = datetime.now().isoformat()
+        return {
+            'created_at': now,
+            'last_updated': now,
+            'agent_state': {}
+        }
+
+    def _queue_set(self, pipe, key: str, data: bytes, create: bool) -> None:
+        """Queue SETEX for a new key, or SET ... XX KEEPTTL to update one.
+
+        XX makes an update a no-op (reply None) if the key expired meanwhile,
+        so a context is never rewritten without a TTL.
+        """
+        if create:
+            pipe.setex(key, self.ttl, data)
+        else:
+            pipe.set(key, data, keepttl=True, xx=True)
+
+    async def _encrypt(self, data: bytes) -> bytes:
+        """Encrypt in-thread for small payloads, in a worker thread for large ones"""
+        if len(data) > EncryptionConfig.THREAD_OFFLOAD_BYTES:
+            return await asyncio.to_thread(self.encryption_service.encrypt, data)
+        return self.encryption_service.encrypt(data)
+
+    async def _decrypt(self, data: bytes) -> bytes:
+        """Decrypt in-thread for small payloads, in a worker thread for large ones"""
+        if len(data) > EncryptionConfig.THREAD_OFFLOAD_BYTES:
+            return await asyncio.to_thread(self.encryption_service.decrypt, data)
+        return self.encryption_service.decrypt(data)
+
     def _handle_redis_error(self, operation: str, error: Exception) -> None:
         """Handle Redis errors with logging"""
         logger.error(f"Redis {operation} failed: {str(error)}")
         raise RedisError(f"Redis {operation} failed: {str(error)}")
 
-    def get_context(self, user_id: str) -> Dict[str, Any]:
+    async def get_context(self, user_id: str) -> Dict[str, Any]:
         """Get context from Redis with decryption and error handling"""
         try:
             key = self._get_key(user_id)
-            encrypted_data = self.redis_client.get(key)
+            encrypted_data = await self.redis_client.get(key)
             
             if not encrypted_data:
                 # Initialize new context if none exists
-                context = {
-                    'created_at': datetime.now().isoformat(),
-                    'last_updated': datetime.now().isoformat(),
-                    'interactions': [],
-                    'agent_state': {}
-                }
-                self.update_context(user_id, context)
+                context = self._new_context()
+                await self.set_context(user_id, context, create=True)
                 return context
 
             # Decrypt and parse context
-            decrypted_data = self.encryption_service.decrypt(encrypted_data)
-            return json.loads(decrypted_data)
+            decrypted_data = await self._decrypt(encrypted_data)
+            return _unpack(decrypted_data)
             
         except RedisError as e:
             self._handle_redis_error("get", e)
         except EncryptionError as e:
             logger.error(f"Decryption failed: {str(e)}")
             raise
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON parsing failed: {str(e)}")
+        except (msgpack.UnpackException, ValueError) as e:
+            logger.error(f"Context parsing failed: {str(e)}")
             raise ValueError(f"Invalid context data: {str(e)}")
         except Exception as e:
             logger.error(f"Unexpected error in get_context: {str(e)}")
             raise
 
-    def update_context(self, user_id: str, new_context: Dict[str, Any]) -> None:
-        """Update context in Redis with encryption and error handling"""
+    async def set_context(self, user_id: str, context: Dict[str, Any], create: bool = False) -> None:
+        """Store an already-merged context with a single encrypt and one command.
+
+        New contexts (create=True) get a fresh TTL; updates keep the existing one.
+        """
         try:
             key = self._get_key(user_id)
-            current_context = self.get_context(user_id)
-            
-            # Update context
-            current_context.update(new_context)
-            current_context['last_updated'] = datetime.now().isoformat()
-            
+            context['last_updated'] = datetime.now().isoformat()
+
             # Encrypt and store
-            encrypted_data = self.encryption_service.encrypt(json.dumps(current_context))
-            self.redis_client.setex(key, self.ttl, encrypted_data)
-            
+            encrypted_data = await self._encrypt(_pack(context))
+            if create:
+                await self.redis_client.setex(key, self.ttl, encrypted_data)
+            elif not await self.redis_client.set(key, encrypted_data, keepttl=True, xx=True):
+                # Key expired since it was read; recreate it with a fresh TTL
+                await self.redis_client.setex(key, self.ttl, encrypted_data)
+
+        except RedisError as e:
+            self._handle_redis_error("set", e)
+        except EncryptionError as e:
+            logger.error(f"Encryption failed: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in set_context: {str(e)}")
+            raise
+
+    async def update_context(self, user_id: str, new_context: Dict[str, Any]) -> None:
+        """Merge new_context into the stored context and write it back.
+
+        Callers that already hold the current context should merge in-process
+        and call set_context instead to skip the extra read.
+        """
+        current_context = await self.get_context(user_id)
+        current_context.update(new_context)
+        await self.set_context(user_id, current_context)
+
+    async def _read_payloads(self, user_ids: List[str]) -> Dict[str, bytes]:
+        """MGET and batch-decrypt stored contexts; missing users are skipped, not created"""
+        if not user_ids:
+            # MGET with no keys is a Redis argument error
+            return {}
+        keys = [self._get_key(user_id) for user_id in user_ids]
+        values = await self.redis_client.mget(keys)
+
+        found = [(user_id, data) for user_id, data in zip(user_ids, values) if data]
+        payloads = [data for _, data in found]
+        if sum(map(len, payloads)) > EncryptionConfig.THREAD_OFFLOAD_BYTES:
+            decrypted = await asyncio.to_thread(self.encryption_service.decrypt_many, payloads)
+        else:
+            decrypted = self.encryption_service.decrypt_many(payloads)
+        return {user_id: payload for (user_id, _), payload in zip(found, decrypted)}
+
+    async def _read_contexts(self, user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Read-only bulk get: only users with a stored context are returned"""
+        payloads = await self._read_payloads(user_ids)
+        return {user_id: _unpack(payload) for user_id, payload in payloads.items()}
+
+    async def get_contexts(self, user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get several contexts with one MGET round-trip and a batch decrypt"""
+        if not user_ids:
+            return {}
+        try:
+            contexts = await self._read_contexts(user_ids)
+
+            # Initialize new contexts for users that have none, in one pipeline
+            missing = {
+                user_id: self._new_context()
+                for user_id in user_ids if user_id not in contexts
+            }
+            if missing:
+                await self._write_contexts(missing, create=True)
+                contexts.update(missing)
+            return contexts
+
+        except RedisError as e:
+            self._handle_redis_error("mget", e)
+        except EncryptionError as e:
+            logger.error(f"Decryption failed: {str(e)}")
+            raise
+        except (msgpack.UnpackException, ValueError) as e:
+            logger.error(f"Context parsing failed: {str(e)}")
+            raise ValueError(f"Invalid context data: {str(e)}")
+        except Exception as e:
+            logger.error(f"Unexpected error in get_contexts: {str(e)}")
+            raise
+
+    async def update_contexts(self, mapping: Dict[str, Dict[str, Any]]) -> None:
+        """Merge and store several contexts using one pipelined write per kind.
+
+        Existing contexts keep their TTL; users without one are created with it.
+        """
+        if not mapping:
+            return
+        try:
+            current = await self._read_contexts(list(mapping))
+            created = {}
+            for user_id, new_context in mapping.items():
+                if user_id in current:
+                    current[user_id].update(new_context)
+                else:
+                    created[user_id] = {**self._new_context(), **new_context}
+            if current:
+                await self._write_contexts(current)
+            if created:
+                await self._write_contexts(created, create=True)
         except RedisError as e:
             self._handle_redis_error("update", e)
         except EncryptionError as e:
             logger.error(f"Encryption failed: {str(e)}")
             raise
         except Exception as e:
-            logger.error(f"Unexpected error in update_context: {str(e)}")
+            logger.error(f"Unexpected error in update_contexts: {str(e)}")
+            raise
+
+    async def _write_contexts(self, contexts: Dict[str, Dict[str, Any]], create: bool = False) -> None:
+        """Encrypt and store several contexts in a non-transactional pipeline"""
+        now = datetime.now().isoformat()
+        for context in contexts.values():
+            context['last_updated'] = now
+        payloads = [_pack(context) for context in contexts.values()]
+        if sum(map(len, payloads)) > EncryptionConfig.THREAD_OFFLOAD_BYTES:
+            encrypted = await asyncio.to_thread(self.encryption_service.encrypt_many, payloads)
+        else:
+            encrypted = self.encryption_service.encrypt_many(payloads)
+        keys = [self._get_key(user_id) for user_id in contexts]
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key, data in zip(keys, encrypted):
+            self._queue_set(pipe, key, data, create)
+        results = await pipe.execute()
+
+        # Updates to keys that expired since they were read; recreate with a TTL
+        expired = [(key, data) for key, data, ok in zip(keys, encrypted, results) if not ok]
+        if expired:
+            pipe = self.redis_client.pipeline(transaction=False)
+            for key, data in expired:
+                self._queue_set(pipe, key, data, create=True)
+            await pipe.execute()
+
+    async def append_interaction(self, user_id: str, interaction: Dict[str, Any]) -> None:
+        """Append one encrypted interaction to the user's capped history list"""
+        try:
+            key = self._get_interactions_key(user_id)
+            encrypted_data = await self._encrypt(_pack(interaction))
+
+            # MULTI so the list can never be created without its TTL
+            pipe = self.redis_client.pipeline(transaction=True)
+            pipe.rpush(key, encrypted_data)
+            pipe.ltrim(key, -RedisConfig.MAX_INTERACTIONS, -1)
+            pipe.expire(key, self.ttl, nx=True)
+            await pipe.execute()
+
+        except RedisError as e:
+            self._handle_redis_error("append", e)
+        except EncryptionError as e:
+            logger.error(f"Encryption failed: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in append_interaction: {str(e)}")
             raise
 
-    def save_context(self, user_id: str, filepath: str) -> None:
+    async def get_interactions(self, user_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get the user's interaction history, oldest first (last `limit` if given)"""
+        if limit is not None and limit < 0:
+            raise ValueError("limit must be non-negative")
+        if limit == 0:
+            return []
+        try:
+            key = self._get_interactions_key(user_id)
+            start = -limit if limit is not None else 0
+            values = await self.redis_client.lrange(key, start, -1)
+            if sum(map(len, values)) > EncryptionConfig.THREAD_OFFLOAD_BYTES:
+                decrypted = await asyncio.to_thread(self.encryption_service.decrypt_many, values)
+            else:
+                decrypted = self.encryption_service.decrypt_many(values)
+            return [_unpack(payload) for payload in decrypted]
+
+        except RedisError as e:
+            self._handle_redis_error("lrange", e)
+        except EncryptionError as e:
+            logger.error(f"Decryption failed: {str(e)}")
+            raise
+        except Exception as e:
+            logger.error(f"Unexpected error in get_interactions: {str(e)}")
+            raise
+
+    async def save_context(self, user_id: str, filepath: str) -> None:
         """Save context to file (for backup) with error handling"""
         try:
-            context = self.get_context(user_id)
-            with open(filepath, 'w') as f:
-                json.dump(context, f)
+            context = await self.get_context(user_id)
+            with open(filepath, 'wb') as f:
+                f.write(orjson.dumps(context, option=JSON_OPTIONS))
         except Exception as e:
             logger.error(f"Failed to save context to file: {str(e)}")
             raise
 
-    def load_context(self, user_id: str, filepath: str) -> None:
+    async def save_contexts(self, user_ids: List[str], filepath: str) -> None:
+        """Save several users' contexts to one backup file in a single pass.
+
+        The file is a JSON object mapping user_id to that user's context, e.g.
+        {"u1": {"created_at": ..., "agent_state": {...}}, ...}. Read-only:
+        users without a stored context are left out. Restore with load_contexts.
+        """
+        try:
+            contexts = await self._read_contexts(user_ids)
+            with open(filepath, 'wb') as f:
+                f.write(orjson.dumps(contexts, option=JSON_OPTIONS))
+        except Exception as e:
+            logger.error(f"Failed to save contexts to file: {str(e)}")
+            raise
+
+    async def train_compression_dictionary(
+        self,
+        user_ids: List[str],
+        filepath: str,
+        dict_size: int = 16 * 1024,
+        min_samples: int = 100
+    ) -> None:
+        """Train a zstd dictionary from stored contexts (see ZSTD_DICT_PATH).
+
+        Read-only: users without a stored context are skipped, not created.
+        """
+        try:
+            # Decrypted payloads are the serialized contexts exactly as stored
+            samples = list((await self._read_payloads(user_ids)).values())
+            if len(samples) < min_samples:
+                raise ValueError(
+                    f"Need at least {min_samples} stored contexts to train a "
+                    f"dictionary, found {len(samples)}"
+                )
+
+            try:
+                dictionary = await asyncio.to_thread(zstd.train_dictionary, dict_size, samples)
+            except zstd.ZstdError as e:
+                raise ValueError(f"Dictionary training failed on {len(samples)} samples: {str(e)}")
+
+            with open(filepath, 'wb') as f:
+                f.write(dictionary.as_bytes())
+
+        except RedisError as e:
+            self._handle_redis_error("mget", e)
+        except Exception as e:
+            logger.error(f"Failed to train compression dictionary: {str(e)}")
+            raise
+
+    async def load_context(self, user_id: str, filepath: str) -> None:
         """Load context from file and store in Redis with error handling"""
         try:
-            with open(filepath, 'r') as f:
-                context = json.load(f)
-            self.update_context(user_id, context)
+            with open(filepath, 'rb') as f:
+                context = orjson.loads(f.read())
+            await self.update_context(user_id, context)
         except Exception as e:
             logger.error(f"Failed to load context from file: {str(e)}")
             raise
 
-    def delete_context(self, user_id: str) -> None:
+    async def load_contexts(self, filepath: str) -> None:
+        """Restore a save_contexts backup ({user_id: context} JSON) in one pipelined write"""
+        try:
+            with open(filepath, 'rb') as f:
+                contexts = orjson.loads(f.read())
+            if not isinstance(contexts, dict) or not all(
+                isinstance(context, dict) for context in contexts.values()
+            ):
+                raise ValueError("Backup file must map user_id to a context object")
+            await self.update_contexts(contexts)
+        except Exception as e:
+            logger.error(f"Failed to load contexts from file: {str(e)}")
+            raise
+
+    async def delete_context(self, user_id: str) -> None:
         """Delete context from Redis with error handling"""
         try:
-            key = self._get_key(user_id)
-            self.redis_client.delete(key)
+            await self.redis_client.delete(
+                self._get_key(user_id),
+                self._get_interactions_key(user_id)
+            )
         except RedisError as e:
             self._handle_redis_error("delete", e)
         except Exception as e:
@@ -1,15 +1,20 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from .protocol.router import router as agent_router
 from .protocol.mcp_client import MCPClient
 
-app = FastAPI(title="Multi-Agent Medical Assistant")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Initialize a single MCP client (model weights, Redis pool, encryption) at startup
+    app.state.mcp_client = MCPClient()
+    yield
+    await app.state.mcp_client.close()
 
-# Initialize MCP client
-mcp_client = MCPClient()
+app = FastAPI(title="Multi-Agent Medical Assistant", lifespan=lifespan)
 
 # Include routers
 app.include_router(agent_router, prefix="/api/v1", tags=["agents"])
 
 @app.get("/")
 async def root():
-    return {"message": "Welcome to the Multi-Agent Medical Assistant API"} 
\ No newline at end of file
+    return {"message": "Welcome to the Multi-Agent Medical Assistant API"}
@@ -1,4 +1,5 @@
-from typing import Dict, Any, Optional
+import asyncio
+from typing import Dict, Any, List, Optional
 from .schemas import AgentRequest, AgentResponse
 from ..context.manager import ContextManager
 from ..agents.base_chat import BaseChatAgent
@@ -20,7 +21,7 @@ class MCPClient:
     async def process_request(self, request: AgentRequest) -> AgentResponse:
         """Process request through MCP pipeline"""
         # 1. Context Layer: Get/Update Context
-        context = self.context_manager.get_context(request.user_id)
+        context = await self.context_manager.get_context(request.user_id)
         request.context = context
 
         # 2. Protocol Layer: Route to appropriate agent
@@ -33,10 +34,22 @@ class MCPClient:
         response = await agent.process(request)
 
         # 4. Context Layer: Update context with response
-        self.context_manager.update_context(request.user_id, response.updated_context)
+        context.update(response.updated_context)
+        writes = [self.context_manager.set_context(request.user_id, context)]
+        if 'last_interaction' in response.updated_context:
+            writes.append(self.context_manager.append_interaction(
+                request.user_id, response.updated_context['last_interaction']
+            ))
+        await asyncio.gather(*writes)
 
         return response
 
+    async def close(self):
+        """Release shared resources on shutdown"""
+        for agent in self.agents.values():
+            await agent.close()
+        await self.context_manager.close()
+
     def register_agent(self, name: str, agent: BaseChatAgent):
         """Register a new agent with the MCP client"""
         agent.set_context_manager(self.context_manager)
@@ -46,14 +59,30 @@ class MCPClient:
         """Get agent by name"""
         return self.agents.get(name)
 
-    def get_context(self, user_id: str) -> Dict[str, Any]:
+    async def get_context(self, user_id: str) -> Dict[str, Any]:
         """Get context for user"""
-        return self.context_manager.get_context(user_id)
+        return await self.context_manager.get_context(user_id)
+
+    async def get_interactions(self, user_id: str, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Get interaction history for user"""
+        return await self.context_manager.get_interactions(user_id, limit)
 
-    def save_context(self, user_id: str, filepath: str):
+    async def get_contexts(self, user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Get contexts for several users in one round-trip"""
+        return await self.context_manager.get_contexts(user_ids)
+
+    async def save_context(self, user_id: str, filepath: str):
         """Save context to file"""
-        self.context_manager.save_context(user_id, filepath)
+        await self.context_manager.save_context(user_id, filepath)
+
+    async def save_contexts(self, user_ids: List[str], filepath: str):
+        """Save several users' contexts to one file"""
+        await self.context_manager.save_contexts(user_ids, filepath)
 
-    def load_context(self, user_id: str, filepath: str):
+    async def load_context(self, user_id: str, filepath: str):
         """Load context from file"""
-        self.context_manager.load_context(user_id, filepath) 
\ No newline at end of file
+        await self.context_manager.load_context(user_id, filepath)
+
+    async def load_contexts(self, filepath: str):
+        """Load several users' contexts from a save_contexts file"""
+        await self.context_manager.load_contexts(filepath) 
\ No newline at end of file
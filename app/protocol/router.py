@@ -1,15 +1,13 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from .schemas import AgentRequest, AgentResponse
-from .mcp_client import MCPClient
 
 router = APIRouter()
-mcp_client = MCPClient()
 
 @router.post("/route")
-async def route_request(request: AgentRequest) -> AgentResponse:
+async def route_request(request: AgentRequest, http_request: Request) -> AgentResponse:
     try:
-        return await mcp_client.process_request(request)
+        return await http_request.app.state.mcp_client.process_request(request)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,21 +1,61 @@
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.exceptions import InvalidTag
-import base64
+from functools import lru_cache
+import itertools
 import os
+import threading
+import zstandard as zstd
 import json
-from typing import Tuple
+from typing import List, Tuple
 from ..config.redis_config import EncryptionConfig
 
+try:
+    # C implementation with precomputed HMAC pads; much faster per iteration
+    from fastpbkdf2 import pbkdf2_hmac
+except ImportError:
+    pbkdf2_hmac = None
+
+@lru_cache(maxsize=8)
+def _derive_key_cached(password: bytes, salt: bytes) -> bytes:
+    """Derive an AES-256 key, shared across service instances"""
+    if EncryptionConfig.KEY_DERIVATION == 'PBKDF2':
+        if pbkdf2_hmac is not None:
+            return pbkdf2_hmac('sha256', password, salt, EncryptionConfig.ITERATIONS, 32)
+        kdf = PBKDF2HMAC(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=salt,
+            iterations=EncryptionConfig.ITERATIONS,
+        )
+        return kdf.derive(password)
+    kdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        info=EncryptionConfig.HKDF_INFO,
+    )
+    return kdf.derive(password)
+
+# First plaintext byte says how the rest of the payload is encoded
+PAYLOAD_RAW = b'\x00'
+PAYLOAD_ZSTD = b'\x01'
+
 class EncryptionService:
     def __init__(self):
         if not EncryptionConfig.ENCRYPTION_KEY:
             raise ValueError("Encryption key not set in environment variables")
+        self._load_or_create_salt()
         self.key = self._derive_key(EncryptionConfig.ENCRYPTION_KEY.encode())
         self.cipher = AESGCM(self.key)
-        self._load_or_create_salt()
+        self._zstd_local = threading.local()
+        self._reseed_nonces()
+        # A forked worker must not continue the parent's nonce sequence
+        os.register_at_fork(after_in_child=self._reseed_nonces)
+        self._zstd_dict = self._load_zstd_dict()
 
     def _load_or_create_salt(self):
         """Load or create a new salt for key derivation"""
@@ -29,31 +69,104 @@ class EncryptionService:
                 f.write(self.salt)
 
     def _derive_key(self, password: bytes) -> bytes:
-        """Derive a key using PBKDF2 with stored salt"""
-        kdf = PBKDF2HMAC(
-            algorithm=hashes.SHA256(),
-            length=32,
-            salt=self.salt,
-            iterations=EncryptionConfig.ITERATIONS,
-        )
-        return base64.urlsafe_b64encode(kdf.derive(password))
+        """Derive a key with stored salt using the configured KDF.
+
+        ENCRYPTION_KEY already carries 32+ bytes of entropy, so HKDF is the
+        default; PBKDF2 is kept for deployments that require it.
+        """
+        return _derive_key_cached(password, self.salt)
+
+    def _reseed_nonces(self):
+        """Start a fresh nonce sequence at a random 96-bit offset"""
+        self._nonce_base = int.from_bytes(os.urandom(EncryptionConfig.NONCE_LENGTH), 'big')
+        self._nonce_counter = itertools.count()
 
-    def encrypt(self, data: str) -> str:
-        """Encrypt data for storage with error handling"""
+    def _next_nonce(self) -> bytes:
+        """Next GCM nonce: random base + process-local counter, no syscall"""
+        n = EncryptionConfig.NONCE_LENGTH
+        value = (self._nonce_base + next(self._nonce_counter)) % (1 << (8 * n))
+        return value.to_bytes(n, 'big')
+
+    def _load_zstd_dict(self):
+        """Load the trained zstd dictionary for small context payloads, if present"""
+        dict_file = EncryptionConfig.ZSTD_DICT_PATH
+        if not os.path.exists(dict_file):
+            return None
+        with open(dict_file, "rb") as f:
+            return zstd.ZstdCompressionDict(f.read())
+
+    def _zstd(self):
+        """Per-thread zstd contexts; they are reused but are not thread-safe"""
+        local = self._zstd_local
+        if not hasattr(local, 'compressor'):
+            local.compressor = zstd.ZstdCompressor(
+                level=EncryptionConfig.COMPRESSION_LEVEL,
+                dict_data=self._zstd_dict
+            )
+            local.decompressor = zstd.ZstdDecompressor()
+            local.dict_decompressor = (
+                zstd.ZstdDecompressor(dict_data=self._zstd_dict)
+                if self._zstd_dict is not None else None
+            )
+        return local
+
+    def _compress(self, data: bytes) -> bytes:
+        """Compress with zstd behind a flag byte, keeping the original if it does not help"""
+        compressed = self._zstd().compressor.compress(data)
+        if len(compressed) < len(data):
+            return PAYLOAD_ZSTD + compressed
+        return PAYLOAD_RAW + data
+
+    def _decompress(self, data: bytes) -> bytes:
+        """Strip the flag byte and decompress if the payload was compressed"""
+        flag, payload = data[:1], data[1:]
+        if flag == PAYLOAD_RAW:
+            return payload
+        if flag != PAYLOAD_ZSTD:
+            raise EncryptionError("Unknown payload encoding")
+        local = self._zstd()
+        # Frames written before a dictionary was deployed carry no dict id
+        if zstd.get_frame_parameters(payload).dict_id and local.dict_decompressor is not None:
+            return local.dict_decompressor.decompress(payload)
+        return local.decompressor.decompress(payload)
+
+    def encrypt(self, data: bytes) -> bytes:
+        """Encrypt data for storage with error handling; returns nonce || ciphertext"""
         try:
-            nonce = os.urandom(EncryptionConfig.NONCE_LENGTH)
-            ciphertext = self.cipher.encrypt(nonce, data.encode(), None)
-            return base64.b64encode(nonce + ciphertext).decode('utf-8')
+            nonce = self._next_nonce()
+            return nonce + self.cipher.encrypt(nonce, self._compress(data), None)
         except Exception as e:
             raise EncryptionError(f"Encryption failed: {str(e)}")
 
-    def decrypt(self, encrypted_data: str) -> str:
+    def decrypt(self, encrypted_data: bytes) -> bytes:
         """Decrypt stored data with error handling"""
         try:
-            raw_data = base64.b64decode(encrypted_data.encode('utf-8'))
-            nonce = raw_data[:EncryptionConfig.NONCE_LENGTH]
-            ciphertext = raw_data[EncryptionConfig.NONCE_LENGTH:]
-            return self.cipher.decrypt(nonce, ciphertext, None).decode('utf-8')
+            nonce = encrypted_data[:EncryptionConfig.NONCE_LENGTH]
+            ciphertext = encrypted_data[EncryptionConfig.NONCE_LENGTH:]
+            return self._decompress(self.cipher.decrypt(nonce, ciphertext, None))
+        except InvalidTag:
+            raise EncryptionError("Data integrity check failed")
+        except Exception as e:
+            raise EncryptionError(f"Decryption failed: {str(e)}")
+
+    def encrypt_many(self, items: List[bytes]) -> List[bytes]:
+        """Encrypt a batch of payloads with error handling"""
+        try:
+            encrypt = self.cipher.encrypt
+            result = []
+            for data in items:
+                nonce = self._next_nonce()
+                result.append(nonce + encrypt(nonce, self._compress(data), None))
+            return result
+        except Exception as e:
+            raise EncryptionError(f"Encryption failed: {str(e)}")
+
+    def decrypt_many(self, items: List[bytes]) -> List[bytes]:
+        """Decrypt a batch of stored payloads with error handling"""
+        try:
+            n = EncryptionConfig.NONCE_LENGTH
+            decrypt = self.cipher.decrypt
+            return [self._decompress(decrypt(data[:n], data[n:], None)) for data in items]
         except InvalidTag:
             raise EncryptionError("Data integrity check failed")
         except Exception as e:
@@ -61,4 +174,8 @@ class EncryptionService:
 
 class EncryptionError(Exception):
     """Custom exception for encryption/decryption errors"""
-    pass 
\ No newline at end of file
+    pass
+
+# Shared instance, created at import so a preloading server (gunicorn --preload)
+# derives the key once in the parent and workers inherit it copy-on-write
+encryption_service = EncryptionService()